@@ -0,0 +1,256 @@
+#!/usr/bin/env python3.9
+"""
+Thread-safe pool of warm undetected-chromedriver instances shared by scrapers.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Callable, Iterator, Optional
+
+from logging_config import get_logger
+
+if TYPE_CHECKING:
+    import undetected_chromedriver as uc
+
+
+class BrowserPool:
+    """
+    Keeps between `min_size` and `max_size` Chrome instances alive and lends
+    them out one caller at a time. Broken drivers are quit and replaced on a
+    later acquire; a background health check pings idle drivers and evicts
+    those unused for longer than `idle_timeout_s` (down to `min_size`).
+    `on_quit` is called with each driver after the pool has quit it.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], uc.Chrome],
+        max_size: int = 1,
+        min_size: int = 0,
+        idle_timeout_s: float = 1800.0,
+        acquire_timeout_s: float = 120.0,
+        health_check_interval_s: float = 30.0,
+        on_quit: Optional[Callable[[uc.Chrome], None]] = None,
+    ):
+        self.factory = factory
+        self.max_size = max(1, max_size)
+        self.min_size = min(max(0, min_size), self.max_size)
+        self.idle_timeout_s = idle_timeout_s
+        self.acquire_timeout_s = acquire_timeout_s
+        self.health_check_interval_s = health_check_interval_s
+        self.on_quit = on_quit
+        self.logger = get_logger("BrowserPool")
+
+        # (driver, last_used monotonic time); most recently used on the right
+        self._idle = deque()
+        self._drivers = set()
+        # Live drivers plus ones still starting up
+        self._total = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._health_thread = None
+
+    def _spawn(self) -> Optional[uc.Chrome]:
+        """
+        Creates a driver for a slot the caller has already reserved.
+        """
+        try:
+            driver = self.factory()
+        except Exception:
+            with self._cond:
+                self._total -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            closed = self._closed
+            if not closed:
+                self._drivers.add(driver)
+                self._start_health_check()
+        if closed:
+            # The pool was closed while this driver was starting up
+            self._quit(driver)
+            with self._cond:
+                self._total -= 1
+            return None
+        return driver
+
+    def _start_health_check(self):
+        if self._health_thread is None and self.health_check_interval_s > 0:
+            self._health_thread = threading.Thread(
+                target=self._health_check_loop, name="browser-pool-health", daemon=True
+            )
+            self._health_thread.start()
+
+    def _quit(self, driver: uc.Chrome):
+        try:
+            driver.quit()
+        except Exception as e:
+            self.logger.debug(f"Error quitting WebDriver: {e}")
+        if self.on_quit:
+            self.on_quit(driver)
+
+    def warm(self):
+        """
+        Starts idle drivers up to `max_size`, cold-starting them in parallel.
+        """
+        with self._cond:
+            missing = 0 if self._closed else self.max_size - self._total
+            self._total += max(0, missing)
+        if missing <= 0:
+            return
+
+        def spawn_idle(_):
+            try:
+                driver = self._spawn()
+            except Exception as e:
+                self.logger.warning(f"Failed to warm WebDriver: {e}")
+                return
+            if driver is not None:
+                self.release(driver)
+
+        with ThreadPoolExecutor(max_workers=missing) as executor:
+            list(executor.map(spawn_idle, range(missing)))
+
+    def checkout(self, timeout: Optional[float] = None) -> uc.Chrome:
+        """
+        Takes an idle driver, creating one if the pool is not yet full, and
+        otherwise waits up to `timeout` seconds for one to be released.
+        Raises TimeoutError if none becomes available.
+        """
+        timeout = self.acquire_timeout_s if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Browser pool is closed")
+                if self._idle:
+                    return self._idle.pop()[0]
+                if self._total < self.max_size:
+                    self._total += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(
+                        f"No WebDriver became available within {timeout:g}s"
+                    )
+                self._cond.wait(remaining)
+
+        driver = self._spawn()
+        if driver is None:
+            raise RuntimeError("Browser pool is closed")
+        return driver
+
+    def release(self, driver: uc.Chrome):
+        """
+        Returns a driver to the pool, replacing it if its session has died.
+        """
+        if not driver.session_id:
+            self.discard(driver)
+            return
+        with self._cond:
+            if not self._closed:
+                self._idle.append((driver, time.monotonic()))
+                self._cond.notify()
+                return
+        self.discard(driver)
+
+    def discard(self, driver: uc.Chrome):
+        """
+        Quits a broken driver; a replacement is created on a later acquire.
+        """
+        with self._cond:
+            if driver not in self._drivers:
+                return  # Already quit by close()
+        self._quit(driver)
+        # Free the slot only once the browser is gone
+        with self._cond:
+            if driver in self._drivers:
+                self._drivers.discard(driver)
+                self._total -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def acquire(self, timeout: Optional[float] = None) -> Iterator[uc.Chrome]:
+        """
+        Lends a driver for the duration of a `with` block. It is returned to
+        the pool on normal exit and discarded if the block raises.
+        """
+        driver = self.checkout(timeout)
+        try:
+            yield driver
+        except BaseException:
+            self.discard(driver)
+            raise
+        self.release(driver)
+
+    def _health_check_loop(self):
+        while not self._stop.wait(self.health_check_interval_s):
+            try:
+                self.health_check()
+            except Exception as e:
+                self.logger.error(f"Browser pool health check failed: {e}")
+
+    def health_check(self):
+        """
+        Evicts drivers idle past `idle_timeout_s` and pings the rest,
+        discarding any that no longer respond.
+        """
+        now = time.monotonic()
+        with self._cond:
+            expired = []
+            to_check = []
+            # Oldest first, so the most recently used drivers are kept
+            while self._idle:
+                driver, last_used = self._idle.popleft()
+                if (
+                    now - last_used > self.idle_timeout_s
+                    and self._total - len(expired) > self.min_size
+                ):
+                    expired.append(driver)
+                else:
+                    to_check.append((driver, last_used))
+
+        for driver in expired:
+            self.logger.info("Closing idle WebDriver")
+            self.discard(driver)
+
+        # Newest first, re-added on the left: recency order is preserved and
+        # drivers released meanwhile stay on the right
+        for driver, last_used in reversed(to_check):
+            try:
+                driver.execute_script("return 1")
+            except Exception as e:
+                self.logger.warning(f"Replacing unresponsive WebDriver: {e}")
+                self.discard(driver)
+                continue
+            with self._cond:
+                if self._closed:
+                    return
+                self._idle.appendleft((driver, last_used))
+                self._cond.notify()
+
+    def close(self):
+        """
+        Stops the health check and quits every driver owned by the pool.
+        """
+        self._stop.set()
+        with self._cond:
+            self._closed = True
+            drivers = list(self._drivers)
+            self._drivers.clear()
+            self._idle.clear()
+            self._cond.notify_all()
+        for driver in drivers:
+            try:
+                driver.quit()
+                self.logger.info("WebDriver closed successfully.")
+            except Exception as e:
+                self.logger.error(f"Error closing WebDriver: {e}")
+            if self.on_quit:
+                self.on_quit(driver)
@@ -1,11 +1,146 @@
 #!/usr/bin/env python3.9
+import os
+import threading
+import orjson
+from collections import OrderedDict
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 import numpy as np
 from PIL import Image
 from io import BytesIO
-from typing import Optional, Tuple
+from pathlib import Path
+from typing import List, Optional, Tuple
 from logging_config import get_logger
 
+# Rec.601 luminance weights used by the sharpness metric
+_LUMA_WEIGHTS = np.array([0.2989, 0.5870, 0.1140], dtype=np.float32)
+
+try:
+    import cv2
+except ImportError:  # OpenCV is optional; fall back to PIL decoding
+    cv2 = None
+
+try:
+    from numba import njit
+except ImportError:  # Numba is optional; fall back to NumPy
+    njit = None
+
+
+def _sharpness(image: np.ndarray) -> float:
+    """
+    Luminance gradient variance (Laplacian variance proxy) of an RGB image.
+
+    Must be given the image at its original resolution: the value grows as
+    an image is downsampled, and `sharpness_threshold` is calibrated on
+    full-size Mercari images.
+    """
+    gray = np.dot(image[..., :3].astype(np.float32), _LUMA_WEIGHTS)
+    grad_y, grad_x = np.gradient(gray)
+    return float((np.abs(grad_y) + np.abs(grad_x)).var())
+
+
+def _image_stats_numpy(
+    image: np.ndarray, bw: int, color_thr2: int, solid_var_threshold: float
+) -> Tuple[int, bool]:
+    """
+    Compute background statistics in one sweep over the image's channel
+    planes.
+
+    Returns:
+        (background_pixels, is_solid_background)
+    """
+    # Work on contiguous per-channel planes (CHW) rather than interleaved HWC
+    planes = np.ascontiguousarray(image.transpose(2, 0, 1))
+    _, height, width = planes.shape
+
+    dist_sq = np.zeros((height, width), dtype=np.int32)
+    diff = np.empty((height, width), dtype=np.int32)
+    stds = []
+    for plane in planes:
+        # Top/bottom strips plus left/right strips (excluding corners)
+        border = np.concatenate([
+            plane[:bw].ravel(),
+            plane[-bw:].ravel(),
+            plane[bw:-bw, :bw].ravel(),
+            plane[bw:-bw, -bw:].ravel(),
+        ])
+        stds.append(border.std(dtype=np.float32))
+
+        # Accumulate squared distance to this channel's border color
+        np.subtract(
+            plane, np.int32(np.rint(border.mean(dtype=np.float32))), out=diff
+        )
+        np.multiply(diff, diff, out=diff)
+        dist_sq += diff
+
+    # If low variance in border, consider it solid background
+    is_solid_background = bool(np.mean(stds) < solid_var_threshold)
+
+    # Count pixels close to border color (squared distance, no sqrt)
+    background_pixels = int(np.count_nonzero(dist_sq < color_thr2))
+
+    return background_pixels, is_solid_background
+
+
+if njit is not None:
+    # Serial on purpose: the kernel is called from the filter's download
+    # threads, and Numba's default parallel backend aborts the process on
+    # concurrent entry.
+    @njit(fastmath=True, cache=True)
+    def _image_stats_numba(image, bw, color_thr2, solid_var_threshold):
+        """Fused kernel equivalent of _image_stats_numpy."""
+        height, width, _ = image.shape
+
+        # Pass 1: per-channel sum and sum of squares over the border
+        s0 = s1 = s2 = 0.0
+        q0 = q1 = q2 = 0.0
+        n = 0
+        for h in range(height):
+            full_row = h < bw or h >= height - bw
+            for w in range(width):
+                if full_row or w < bw or w >= width - bw:
+                    r = float(image[h, w, 0])
+                    g = float(image[h, w, 1])
+                    b = float(image[h, w, 2])
+                    s0 += r
+                    s1 += g
+                    s2 += b
+                    q0 += r * r
+                    q1 += g * g
+                    q2 += b * b
+                    n += 1
+
+        m0 = s0 / n
+        m1 = s1 / n
+        m2 = s2 / n
+        std0 = np.sqrt(max(q0 / n - m0 * m0, 0.0))
+        std1 = np.sqrt(max(q1 / n - m1 * m1, 0.0))
+        std2 = np.sqrt(max(q2 / n - m2 * m2, 0.0))
+        is_solid_background = (std0 + std1 + std2) / 3.0 < solid_var_threshold
+
+        # Pass 2: pixels close to the border color
+        b0 = int(round(m0))
+        b1 = int(round(m1))
+        b2 = int(round(m2))
+        count = 0
+        for h in range(height):
+            for w in range(width):
+                dr = int(image[h, w, 0]) - b0
+                dg = int(image[h, w, 1]) - b1
+                db = int(image[h, w, 2]) - b2
+                if dr * dr + dg * dg + db * db < color_thr2:
+                    count += 1
+
+        return count, is_solid_background
+
+    def _image_stats(image, bw, color_thr2, solid_var_threshold):
+        return _image_stats_numba(
+            np.ascontiguousarray(image), bw, color_thr2, solid_var_threshold
+        )
+else:
+    _image_stats = _image_stats_numpy
+
 
 class ImageFilter:
     """
@@ -21,40 +156,107 @@ class ImageFilter:
         self.background_color_threshold = config["filtering"]["background_color_threshold"]
         self.max_solid_color_ratio = config["filtering"]["max_solid_color_ratio"]
         self.enabled = config["filtering"]["background_filter_enabled"]
+        
+        # Per-pixel color distance and border spread thresholds
+        self._color_thr = int(config["filtering"].get("color_threshold", 30))
+        self._color_thr2 = self._color_thr * self._color_thr
+        self._solid_var_thr = float(config["filtering"].get("solid_var_threshold", 20.0))
+        
+        # Minimum luminance-gradient variance for an image to count as sharp,
+        # measured at the image's original resolution
+        self._sharpness_thr = float(config["filtering"].get("sharpness_threshold", 1000))
+        
+        # Shared session so image downloads reuse CDN connections
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=32, max_retries=1)
+        self.session.mount('https://', adapter)
+        
+        # Verdicts keyed by image URL; repeat URLs skip download and analysis.
+        # Persisted across runs since listings keep their CDN image URLs.
+        cache_file = config["filtering"].get("verdict_cache_file")
+        self._cache_path = Path(cache_file) if cache_file else None
+        self._cache_size = int(config["filtering"].get("verdict_cache_size", 200000))
+        self._cache_lock = threading.Lock()
+        # Settings a verdict depends on; a cache saved under others is stale
+        self._cache_fingerprint = {
+            "max_solid_color_ratio": self.max_solid_color_ratio,
+            "color_threshold": self._color_thr,
+            "solid_var_threshold": self._solid_var_thr,
+            "sharpness_threshold": self._sharpness_thr,
+        }
+        # Least recently used first, so eviction drops the coldest URL
+        self._verdicts: "OrderedDict[str, bool]" = self._load_verdicts()
     
-    def _download_image(self, image_url: str) -> Optional[np.ndarray]:
+    def _download_image(
+        self, image_url: str
+    ) -> Optional[Tuple[np.ndarray, Tuple[int, int], float]]:
         """
-        Download and convert image to RGB array.
+        Download and convert image to an RGB array.
         
         Args:
             image_url: URL of the image to download
             
         Returns:
-            RGB numpy array or None if download fails
+            (RGB numpy array, original (width, height), full-resolution
+            sharpness) or None if download fails
         """
         try:
             if not image_url:
                 return None
                 
-            response = requests.get(image_url, timeout=30)
-            response.raise_for_status()
-            
-            # Open image with PIL
-            img = Image.open(BytesIO(response.content))
-            
-            # Convert to RGB if necessary
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            # Convert to numpy array
-            np_image = np.array(img)
-            
-            return np_image
+            with self.session.get(image_url, timeout=(5, 25), stream=True) as response:
+                response.raise_for_status()
+                
+                if cv2 is not None:
+                    data = response.content
+                    decoded = self._decode_with_cv2(data)
+                    if decoded is not None:
+                        return decoded
+                    # OpenCV couldn't decode this format; let PIL try
+                    return self._decode_with_pil(BytesIO(data))
+                
+                # Open image with PIL straight from the response stream
+                response.raw.decode_content = True
+                return self._decode_with_pil(response.raw)
             
         except Exception as e:
             self.logger.debug(f"Failed to download/process image: {e}")
             return None
     
+    def _decode_with_pil(
+        self, fp
+    ) -> Tuple[np.ndarray, Tuple[int, int], float]:
+        """
+        Decode an image file object with PIL into an RGB array.
+        """
+        img = Image.open(fp)
+        original_size = img.size
+        
+        # Convert to RGB if necessary
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        
+        # Analyzed at full size: downsampling averages textured backgrounds
+        # toward solid colors and skews both sharpness and background ratios
+        rgb = np.array(img)
+        return rgb, original_size, _sharpness(rgb)
+    
+    def _decode_with_cv2(
+        self, data: bytes
+    ) -> Optional[Tuple[np.ndarray, Tuple[int, int], float]]:
+        """
+        Decode image bytes with OpenCV into an RGB array.
+        Returns None if OpenCV cannot decode the data.
+        """
+        bgr = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if bgr is None:
+            return None
+        rgb = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+        
+        height, width = rgb.shape[:2]
+        # Analyzed at full size, like the PIL path
+        return rgb, (width, height), _sharpness(rgb)
+    
     def _calculate_background_ratio(self, image: np.ndarray) -> float:
         """
         Calculate the ratio of solid/dull background to total image.
@@ -78,100 +280,78 @@ class ImageFilter:
             
             # Sample pixels from the edges (border area)
             border_width = max(1, min(width // 10, height // 10, 20))
-            
-            # Create mask for border pixels
-            border_pixels = []
-            
-            # Top and bottom borders
-            for w in range(width):
-                for h in range(border_width):
-                    border_pixels.append(image[h, w])
-                    border_pixels.append(image[height-1-h, w])
-            
-            # Left and right borders
-            for h in range(border_width, height - border_width):
-                for w in range(border_width):
-                    border_pixels.append(image[h, w])
-                    border_pixels.append(image[h, width-1-w])
-            
-            border_pixels = np.array(border_pixels)
-            
-            # Calculate dominant color in border
-            border_color = np.mean(border_pixels, axis=0)
-            
-            # Calculate color variance in border
-            color_threshold = 30  # Color difference threshold
-            border_variance = np.std(border_pixels, axis=0)
-            avg_variance = np.mean(border_variance)
-            
-            # If low variance in border, consider it solid background
-            is_solid_background = avg_variance < 20
-            
-            # Count pixels close to border color
-            color_diff = np.linalg.norm(image - border_color, axis=2)
-            background_pixels = np.sum(color_diff < color_threshold)
-            
+
+            background_pixels, is_solid_background = _image_stats(
+                image, border_width, self._color_thr2, self._solid_var_thr
+            )
+
             # Calculate ratio
             background_ratio = background_pixels / total_pixels
             
-            # Handle edge case where solid color takes over
-            if is_solid_background and background_ratio < 0.1:
-                background_ratio = 0.1  # Force minimum background
+            # Handle edge case where solid color takes over (minimum 0.1)
+            background_ratio = (
+                max(background_ratio, 0.1) if is_solid_background else background_ratio
+            )
             
             return float(background_ratio)
             
         except Exception as e:
-            self.logger.debug(f"Error calculating background ratio: {e}")
+            self.logger.debug(f"Error analyzing image data: {e}")
             return 0.0
     
-    def _is_low_quality(self, image: np.ndarray) -> bool:
+    def _is_low_quality(
+        self,
+        image: np.ndarray,
+        original_size: Optional[Tuple[int, int]] = None,
+        sharpness: Optional[float] = None,
+    ) -> bool:
         """
         Check if image is low quality (blurry, low resolution).
         
         Args:
             image: RGB numpy array
+            original_size: (width, height) of the source image, if known
+            sharpness: Sharpness measured at the original resolution; computed
+                from `image` if omitted, which must then be full size
             
         Returns:
             bool: True if image is low quality
         """
         try:
-            height, width, _ = image.shape
+            if original_size is not None:
+                width, height = original_size
+            else:
+                height, width, _ = image.shape
             
             # Check minimum resolution
             if height < 100 or width < 100:
                 return True
             
-            # Calculate image sharpness (Laplacian variance)
-            gray = np.dot(image[...,:3], [0.2989, 0.5870, 0.1140])
-            
-            # Simple edge detection
-            laplacian = np.abs(np.gradient(gray)[0]) + np.abs(np.gradient(gray)[1])
-            sharpness = laplacian.var()
+            if sharpness is None:
+                sharpness = _sharpness(image)
             
-            # Threshold for sharpness (tuned for Mercari images)
-            sharpness_threshold = 1000
-            
-            return sharpness < sharpness_threshold
+            return sharpness < self._sharpness_thr
             
         except Exception as e:
             self.logger.debug(f"Error checking image quality: {e}")
             return False
     
-    def _has_solid_color_background(self, image: np.ndarray) -> bool:
+    def _has_solid_color_background(
+        self, image: np.ndarray, background_ratio: Optional[float] = None
+    ) -> bool:
         """
         Check if image has a solid color background.
         
         Args:
             image: RGB numpy array
+            background_ratio: Precomputed background ratio, if available
             
         Returns:
             bool: True if image has solid background
         """
         try:
-            if not self.enabled:
-                return False
-            
-            background_ratio = self._calculate_background_ratio(image)
+            if background_ratio is None:
+                background_ratio = self._calculate_background_ratio(image)
             
             # If background ratio exceeds threshold, consider it solid
             passes_filter = background_ratio > self.max_solid_color_ratio
@@ -190,6 +370,7 @@ class ImageFilter:
     def filter_background(self, image_url: str) -> bool:
         """
         Main filtering method to determine if an image should be included.
+        Results are cached per image URL and persisted across runs.
         
         Args:
             image_url: URL of the product image
@@ -197,18 +378,73 @@ class ImageFilter:
         Returns:
             bool: True if image passes filtering, False otherwise
         """
-        try:
-            if not self.enabled:
-                return True  # Pass all images if filtering is disabled
+        if not self.enabled:
+            return True  # Pass all images if filtering is disabled
+        
+        with self._cache_lock:
+            verdict = self._verdicts.get(image_url)
+            if verdict is not None:
+                self._verdicts.move_to_end(image_url)
+                return verdict
+        
+        verdict = self._filter_background_impl(image_url)
+        if verdict is None:
+            return True  # Undecided (e.g. download failed); retry next time
+        
+        with self._cache_lock:
+            self._verdicts[image_url] = verdict
+            if len(self._verdicts) > self._cache_size:
+                self._verdicts.popitem(last=False)
+        return verdict
+    
+    def filter_background_batch(
+        self, image_urls: List[str], max_workers: int = 8
+    ) -> List[bool]:
+        """
+        Filter several images concurrently, downloading them in parallel.
+        
+        Args:
+            image_urls: URLs of the product images
+            max_workers: Maximum number of concurrent downloads
             
+        Returns:
+            list: filter_background verdict for each URL, in input order
+        """
+        if not self.enabled:
+            return [True] * len(image_urls)
+        
+        def filter_one(image_url: str) -> bool:
+            # One failing URL must not abort the batch; allow it instead
+            if not image_url:
+                return True
+            try:
+                return self.filter_background(image_url)
+            except Exception as e:
+                self.logger.warning(f"Error in background filtering: {e}")
+                return True
+        
+        # Each distinct URL is fetched once even if listed several times
+        unique_urls = list(dict.fromkeys(image_urls))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            verdicts = dict(zip(unique_urls, executor.map(filter_one, unique_urls)))
+        
+        return [verdicts[url] for url in image_urls]
+    
+    def _filter_background_impl(self, image_url: str) -> Optional[bool]:
+        """
+        Uncached implementation of filter_background.
+        Returns None when no verdict could be reached.
+        """
+        try:
             # Download and process image
-            image = self._download_image(image_url)
-            if image is None:
+            downloaded = self._download_image(image_url)
+            if downloaded is None:
                 # If we can't download/process, allow the image
-                return True
+                return None
+            image, original_size, sharpness = downloaded
             
             # Check image quality first
-            if self._is_low_quality(image):
+            if self._is_low_quality(image, original_size, sharpness):
                 self.logger.debug("Image filtered: low quality")
                 return False
             
@@ -224,7 +460,7 @@ class ImageFilter:
         except Exception as e:
             self.logger.warning(f"Error in background filtering: {e}")
             # On error, allow the image
-            return True
+            return None
     
     def analyze_image(self, image_url: str) -> Optional[dict]:
         """
@@ -237,14 +473,16 @@ class ImageFilter:
             dict: Analysis results
         """
         try:
-            image = self._download_image(image_url)
-            if image is None:
+            downloaded = self._download_image(image_url)
+            if downloaded is None:
                 return None
+            image, (width, height), sharpness = downloaded
             
-            height, width, _ = image.shape
             background_ratio = self._calculate_background_ratio(image)
-            low_quality = self._is_low_quality(image)
-            solid_background = self._has_solid_color_background(image)
+            low_quality = self._is_low_quality(image, (width, height), sharpness)
+            solid_background = self._has_solid_color_background(
+                image, background_ratio
+            )
             
             return {
                 "url": image_url,
@@ -258,6 +496,64 @@ class ImageFilter:
         except Exception as e:
             self.logger.error(f"Error analyzing image: {e}")
             return None
+    
+    def _load_verdicts(self) -> "OrderedDict[str, bool]":
+        """
+        Loads persisted filter verdicts, starting empty if there are none or
+        they were made with different filter settings.
+        """
+        if self._cache_path is None or not self._cache_path.exists():
+            return OrderedDict()
+        try:
+            with open(self._cache_path, "rb") as f:
+                data = orjson.loads(f.read())
+            if (
+                not isinstance(data, dict)
+                or data.get("fingerprint") != self._cache_fingerprint
+            ):
+                self.logger.info("Filter settings changed; discarding cached verdicts")
+                return OrderedDict()
+            verdicts = OrderedDict(data.get("verdicts", {}))
+            while len(verdicts) > self._cache_size:
+                # Saved least recently used first
+                verdicts.popitem(last=False)
+            self.logger.info(f"Loaded {len(verdicts)} cached filter verdicts")
+            return verdicts
+        except Exception as e:
+            self.logger.warning(f"Failed to load filter verdict cache: {e}")
+            return OrderedDict()
+    
+    def save_cache(self):
+        """
+        Writes cached filter verdicts to disk, replacing the file atomically.
+        """
+        if self._cache_path is None:
+            return
+        with self._cache_lock:
+            data = orjson.dumps(
+                {"fingerprint": self._cache_fingerprint, "verdicts": self._verdicts}
+            )
+        tmp_path = self._cache_path.with_suffix(".tmp")
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self._cache_path)
+        except Exception as e:
+            self.logger.warning(f"Failed to save filter verdict cache: {e}")
+    
+    def clear_cache(self):
+        """
+        Drops all cached filter verdicts.
+        """
+        with self._cache_lock:
+            self._verdicts.clear()
+    
+    def close(self):
+        """
+        Persists cached verdicts and closes the HTTP session used for downloads.
+        """
+        self.save_cache()
+        self.session.close()
 
 
 if __name__ == "__main__":
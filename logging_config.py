@@ -1,17 +1,80 @@
 #!/usr/bin/env python3.9
+import atexit
 import logging
 import json
 import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
 from datetime import datetime
 from pythonjsonlogger import jsonlogger
 # Import the process-safe handler instead of the standard one
 from concurrent_log_handler import ConcurrentRotatingFileHandler
 
 
+# All loggers feed one queue; a single background listener owns the handlers
+_log_queue = queue.Queue(-1)
+_listener = None
+
+
+def _start_listener(log_dir: str) -> None:
+    """Create the shared handlers and start the queue listener once."""
+    global _listener
+    if _listener is not None:
+        return
+
+    # Create logs directory if it doesn't exist
+    os.makedirs(log_dir, exist_ok=True)
+
+    # Setup formatters
+    console_formatter = logging.Formatter(
+        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    json_formatter = jsonlogger.JsonFormatter(
+        fmt='%(asctime)s %(name)s %(levelname)s %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+
+    # Console handler
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(logging.INFO)
+    console_handler.setFormatter(console_formatter)
+
+    # Use the concurrent handler to prevent file locking errors on Windows
+    file_handler = ConcurrentRotatingFileHandler(
+        os.path.join(log_dir, 'mercari_monitor.json'),
+        maxBytes=10*1024*1024,  # 10MB
+        backupCount=5
+    )
+    file_handler.setLevel(logging.DEBUG)
+    file_handler.setFormatter(json_formatter)
+
+    # Use the concurrent handler for the error log as well
+    error_handler = ConcurrentRotatingFileHandler(
+        os.path.join(log_dir, 'mercari_monitor_errors.json'),
+        maxBytes=5*1024*1024,  # 5MB
+        backupCount=3
+    )
+    error_handler.setLevel(logging.ERROR)
+    error_handler.setFormatter(json_formatter)
+
+    _listener = QueueListener(
+        _log_queue,
+        console_handler,
+        file_handler,
+        error_handler,
+        respect_handler_level=True,
+    )
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
 class StructuredLogger:
     """
     Structured JSON logger for the Mercari monitoring tool.
     Provides both console and file logging with rotation using a process-safe handler.
+    Records are handed to a background thread through a queue, so callers never
+    block on file I/O.
     """
 
     def __init__(self, name: str, log_dir: str = "logs"):
@@ -21,48 +84,14 @@ class StructuredLogger:
             self.logger.handlers.clear()
 
         self.logger.setLevel(logging.DEBUG)
+        # Our queue handler is the only sink; don't re-emit via the root logger
+        self.logger.propagate = False
 
-        # Create logs directory if it doesn't exist
         self.log_dir = log_dir
-        os.makedirs(self.log_dir, exist_ok=True)
-
-        # Setup formatters
-        console_formatter = logging.Formatter(
-            '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-        )
-
-        json_formatter = jsonlogger.JsonFormatter(
-            fmt='%(asctime)s %(name)s %(levelname)s %(message)s',
-            datefmt='%Y-%m-%d %H:%M:%S'
-        )
-
-        # Console handler
-        console_handler = logging.StreamHandler()
-        console_handler.setLevel(logging.INFO)
-        console_handler.setFormatter(console_formatter)
-
-        # Use the concurrent handler to prevent file locking errors on Windows
-        file_handler = ConcurrentRotatingFileHandler(
-            os.path.join(self.log_dir, 'mercari_monitor.json'),
-            maxBytes=10*1024*1024,  # 10MB
-            backupCount=5
-        )
-        file_handler.setLevel(logging.DEBUG)
-        file_handler.setFormatter(json_formatter)
-
-        # Use the concurrent handler for the error log as well
-        error_handler = ConcurrentRotatingFileHandler(
-            os.path.join(self.log_dir, 'mercari_monitor_errors.json'),
-            maxBytes=5*1024*1024,  # 5MB
-            backupCount=3
-        )
-        error_handler.setLevel(logging.ERROR)
-        error_handler.setFormatter(json_formatter)
-
-        # Add handlers to logger
-        self.logger.addHandler(console_handler)
-        self.logger.addHandler(file_handler)
-        self.logger.addHandler(error_handler)
+        _start_listener(self.log_dir)
+
+        # Only enqueue here; the shared listener does formatting and writes
+        self.logger.addHandler(QueueHandler(_log_queue))
 
     def debug(self, message: str, **kwargs):
         self.logger.debug(message, extra=kwargs)
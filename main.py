@@ -4,17 +4,23 @@ Mercari.jp Monitoring Tool
 Main orchestrator for automated product monitoring and notification system.
 """
 
-import json
+import signal
+import threading
 import time
-import schedule
+import orjson
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from pathlib import Path
+from typing import Union
 
 from logging_config import get_logger
-from mercari_scraper import MercariScraper
+from mercari_scraper import (
+    MercariScraper,
+    MercariHttpScraper,
+    PlaywrightMercariScraper,
+)
 from telegram_notifier import TelegramNotifier
 from product_storage import ProductStorage
-from image_filter import ImageFilter
 
 # Load environment variables
 load_dotenv()
@@ -29,33 +35,73 @@ class MercariMonitor:
     def __init__(self, config_path: str = "config.json"):
         self.config_path = Path(config_path)
         self.config = self.load_config()
+        self._stop = threading.Event()
+        # (mtime_ns, queries) of the last parsed search_queries.txt
+        self._queries_cache = None
 
         # Initialize components
         self.logger = get_logger("MercariMonitor")
         # --- CORRECTED to match your config.json ---
         self.storage = ProductStorage(
-            max_storage_days=self.config["storage"]["cleanup_after_days"]
+            max_storage_days=self.config["storage"]["cleanup_after_days"],
+            compact_every=self.config["storage"].get("journal_compact_every", 1000),
         )
-        self.scraper = MercariScraper(self.config)
+        self.storage_lock = threading.Lock()
+        # IDs queued for notification but not yet recorded in storage. They
+        # are stored only once sent, so a crash re-notifies instead of losing
+        # them; until then this set keeps them from being queued twice.
+        self._pending_ids = set()
+
+        # Workers share one scraper; it hands each search its own driver
+        self.max_concurrency = max(
+            1, self.config["timing"].get("max_concurrency", 1)
+        )
+        self.scraper = self._create_scraper()
+
         self.notifier = TelegramNotifier(self.config)
-        self.image_filter = ImageFilter(self.config)
+
+        # Only pay for numpy/PIL imports when background filtering is on
+        self.image_filter = None
+        if self.config["filtering"]["background_filter_enabled"]:
+            from image_filter import ImageFilter
+            self.image_filter = ImageFilter(self.config)
 
         self.logger.info(
             "Mercari Monitor initialized",
             headless=self.config["browser"]["headless"],
         )
 
+        # Browser-only mode: cold-start the driver pool in the background so
+        # it overlaps startup; early searches wait on the pool, not a new driver.
+        # Started last: if any component above fails, no browser is launched.
+        if not isinstance(self.scraper, MercariHttpScraper):
+            threading.Thread(
+                target=self.scraper.warm_up, name="driver-warmup", daemon=True
+            ).start()
+
+    def _create_scraper(
+        self,
+    ) -> Union[MercariScraper, PlaywrightMercariScraper, MercariHttpScraper]:
+        """Create a scraper, preferring the API path with a browser fallback."""
+        if self.config["browser"].get("engine") == "playwright":
+            browser_scraper = PlaywrightMercariScraper(self.config)
+        else:
+            browser_scraper = MercariScraper(self.config)
+        if self.config.get("api", {}).get("enabled", False):
+            return MercariHttpScraper(self.config, fallback=browser_scraper)
+        return browser_scraper
+
     def load_config(self) -> dict:
         """Load configuration from JSON file."""
         try:
-            with open(self.config_path, "r", encoding="utf-8") as f:
-                return json.load(f)
+            with open(self.config_path, "rb") as f:
+                return orjson.loads(f.read())
         except Exception as e:
             logger.error("Failed to load config", error=str(e))
             raise
 
-    def load_search_queries(self) -> list:
-        """Load search queries from text file."""
+    def load_search_queries(self) -> tuple:
+        """Load search queries from text file, re-parsing only when it changes."""
         try:
             queries_file = Path("search_queries.txt")
             if not queries_file.exists():
@@ -63,14 +109,19 @@ class MercariMonitor:
                     "search_queries.txt not found, creating empty file"
                 )
                 queries_file.touch()
-                return []
+                return ()
+
+            mtime = queries_file.stat().st_mtime_ns
+            if self._queries_cache is not None and self._queries_cache[0] == mtime:
+                return self._queries_cache[1]
 
-            with open(queries_file, "r", encoding="utf-8") as f:
-                queries = [
-                    line.strip()
-                    for line in f
-                    if line.strip() and not line.startswith("#")
-                ]
+            data = queries_file.read_text(encoding="utf-8")
+            queries = tuple(
+                line.strip()
+                for line in data.splitlines()
+                if line.strip() and not line.startswith("#")
+            )
+            self._queries_cache = (mtime, queries)
 
             self.logger.info(
                 "Loaded search queries", query_count=len(queries)
@@ -79,10 +130,11 @@ class MercariMonitor:
 
         except Exception as e:
             self.logger.error("Failed to load search queries", error=str(e))
-            return []
+            return ()
 
     def process_query(self, query: str) -> None:
         """Process a single search query and notify of new products."""
+        filter_enabled = self.image_filter is not None
         try:
             self.logger.info("Processing query", query=query)
 
@@ -93,28 +145,48 @@ class MercariMonitor:
                 query=query,
             )
 
-            new_products = []
+            product_ids = [p["id"] for p in products]
+            with self.storage_lock:
+                known = self.storage.are_known(product_ids)
+                known.update(self._pending_ids.intersection(product_ids))
+            candidates = []
             for product in products:
-                if not self.storage.is_product_known(product["id"]):
-                    # Apply background filter if enabled
-                    if self.config["filtering"]["background_filter_enabled"]:
-                        try:
-                            if not self.image_filter.filter_background(
-                                product["image_url"]
-                            ):
-                                self.logger.debug(
-                                    "Skipped product due to background filter",
-                                    product_id=product["id"],
-                                )
-                                continue
-                        except Exception:
-                            self.logger.log_exception(
-                                "Background filter failed",
-                                product_id=product["id"],
-                            )
-
-                    new_products.append(product)
-                    self.storage.add_product(product)
+                if product["id"] not in known:
+                    # Also skips repeats of the same listing within one page
+                    known.add(product["id"])
+                    candidates.append(product)
+
+            # Apply background filter if enabled; downloads run in parallel
+            if candidates and filter_enabled:
+                workers = self.config["filtering"].get("parallel_workers", 8)
+                try:
+                    verdicts = self.image_filter.filter_background_batch(
+                        [p["image_url"] for p in candidates], max_workers=workers
+                    )
+                except Exception:
+                    self.logger.log_exception(
+                        "Background filter failed", query=query
+                    )
+                    verdicts = [True] * len(candidates)
+            else:
+                verdicts = [True] * len(candidates)
+
+            passed = []
+            for product, passes in zip(candidates, verdicts):
+                if passes:
+                    passed.append(product)
+                else:
+                    self.logger.debug(
+                        "Skipped product due to background filter",
+                        product_id=product["id"],
+                    )
+
+            with self.storage_lock:
+                # A concurrent query may have claimed some while filtering
+                claimed = self.storage.are_known(p["id"] for p in passed)
+                claimed.update(self._pending_ids)
+                new_products = [p for p in passed if p["id"] not in claimed]
+                self._pending_ids.update(p["id"] for p in new_products)
 
             if new_products:
                 self.logger.info(
@@ -122,7 +194,9 @@ class MercariMonitor:
                     count=len(new_products),
                     query=query,
                 )
-                self.notifier.send_notifications(new_products, query)
+                self.notifier.send_notifications(
+                    new_products, query, on_sent=self._mark_notified
+                )
             else:
                 self.logger.debug("No new products for query", query=query)
 
@@ -135,6 +209,17 @@ class MercariMonitor:
                 query=query,
             )
 
+    def _mark_notified(self, products: list) -> None:
+        """Record products as known once their notification was attempted."""
+        with self.storage_lock:
+            self.storage.add_products(products)
+            self._pending_ids.difference_update(p["id"] for p in products)
+
+    def _run_query(self, query: str) -> None:
+        """Process one query, then pause before the worker takes another."""
+        self.process_query(query)
+        time.sleep(self.config["timing"]["search_delay"])
+
     def run_once(self) -> None:
         """Run monitoring once for all queries."""
         try:
@@ -145,11 +230,13 @@ class MercariMonitor:
 
             self.logger.info("Starting monitoring cycle")
 
-            for query in queries:
-                self.process_query(query)
-                time.sleep(self.config["timing"]["search_delay"])
+            # Queries run in parallel; each search checks out its own driver
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+                list(executor.map(self._run_query, queries))
 
-            self.storage.cleanup_old_products()
+            # The notifier thread adds products concurrently
+            with self.storage_lock:
+                self.storage.cleanup_old_products()
             self.logger.info("Monitoring cycle completed")
 
         except Exception as e:
@@ -161,12 +248,21 @@ class MercariMonitor:
             "Starting continuous monitoring",
             interval_minutes=interval_minutes,
         )
-        schedule.every(interval_minutes).minutes.do(self.run_once)
+        interval = interval_minutes * 60
+        signal.signal(signal.SIGTERM, lambda *_: self._stop.set())
         try:
-            self.run_once()
-            while True:
-                schedule.run_pending()
-                time.sleep(60)
+            next_run = time.monotonic()
+            while not self._stop.is_set():
+                # Sleep until the next deadline; a stop request wakes us early
+                delay = next_run - time.monotonic()
+                if delay > 0 and self._stop.wait(delay):
+                    break
+                self.run_once()
+                # Advance from the deadline, not from now, so runs don't drift
+                next_run += interval
+                if next_run < time.monotonic():
+                    next_run = time.monotonic()
+            self.logger.info("Monitoring stopped by signal")
         except KeyboardInterrupt:
             self.logger.info("Monitoring stopped by user")
         except Exception as e:
@@ -174,13 +270,22 @@ class MercariMonitor:
 
     def close(self):
         """Cleanup resources and save data."""
-        try:
-            self.logger.info("Saving product database...")
-            self.storage.save_products()
-            self.scraper.close()
-            self.logger.info("Mercari Monitor closed")
-        except Exception as e:
-            self.logger.error("Error during cleanup", error=str(e))
+        # Drain queued notifications first: products are only recorded in
+        # storage once their send completes. Each step runs even if an
+        # earlier one fails.
+        steps = [
+            ("notifier", self.notifier.close),
+            ("storage", self.storage.save_products),
+            ("scraper", self.scraper.close),
+        ]
+        if self.image_filter is not None:
+            steps.append(("image_filter", self.image_filter.close))
+        for name, step in steps:
+            try:
+                step()
+            except Exception as e:
+                self.logger.error("Error during cleanup", step=name, error=str(e))
+        self.logger.info("Mercari Monitor closed")
 
 
 def main():
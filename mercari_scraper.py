@@ -4,70 +4,136 @@ Mercari.jp scraping utility using undetected-chromedriver to bypass bot detectio
 This version is corrected to parse the true Yen price from the aria-label.
 """
 
+from __future__ import annotations
+
 import re
 import time
 import os
-import json
-from typing import List, Dict, Optional
+import asyncio
+import base64
+import queue
+import sys
+import threading
+import uuid
+from typing import TYPE_CHECKING, Any, List, Dict, Optional, Union
 from urllib.parse import quote
 
-import undetected_chromedriver as uc
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
+import orjson
+import requests
+from requests.adapters import HTTPAdapter
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.asymmetric.utils import decode_dss_signature
 
+from browser_pool import BrowserPool
 from logging_config import get_logger
 
+# Selenium and undetected-chromedriver are imported where a browser is
+# actually started, so API-only runs never load them
+if TYPE_CHECKING:
+    import undetected_chromedriver as uc
+
+try:
+    from playwright.async_api import async_playwright
+    from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+except ImportError:  # Optional: only needed for browser.engine = "playwright"
+    async_playwright = None
+    PlaywrightTimeoutError = None
+
+# Compiled once; these run for every listing on every search
+_PRICE_LABEL_RE = re.compile(r"([\d,]+)円")
+_ITEM_ID_RE = re.compile(r"/item/(m\d+)")
+_UNSAFE_FN_RE = re.compile(r'[\\/*?:"<>|]')
+
+# Collects the raw fields of every listing card in a single execute_script
+# call; missing elements come back as null and are validated in Python.
+_EXTRACT_LISTINGS_JS = """
+const [listingSelector, sel] = arguments;
+const read = (el, css, fn) => {
+    const node = el.querySelector(css);
+    return node ? fn(node) : null;
+};
+const rows = [];
+for (const el of document.querySelectorAll(listingSelector)) {
+    // Cheapest discriminating check first: tiles without an item link
+    // (ads, placeholders) are skipped before any other field is read
+    const url = read(el, sel.url, (n) => n.href);
+    if (!url || !url.includes("/item/")) continue;
+    rows.push({
+        url: url,
+        price_label: read(el, "div[role='img']", (n) => n.getAttribute("aria-label")),
+        title: read(el, sel.title, (n) => n.innerText),
+        // The src property, like href above, is resolved to an absolute URL
+        image_url: read(el, sel.image, (n) => n.src || null),
+    });
+}
+return rows;
+"""
+# The same extractor as a Playwright page function taking [listing, item] args
+_PW_EXTRACT_LISTINGS_JS = (
+    "(args) => (function () {" + _EXTRACT_LISTINGS_JS + "}).apply(null, args)"
+)
+
+# Resource types Playwright pages never fetch; the scraper only reads the DOM
+_PW_BLOCKED_RESOURCE_TYPES = frozenset({"image", "font", "stylesheet", "media"})
+
+
+# Raw fields of one listing card as returned by _EXTRACT_LISTINGS_JS
+ListingRow = Dict[str, Optional[str]]
+# A scraped product: id, title, price (int yen), url and image_url
+Product = Dict[str, Any]
 
-class MercariScraper:
+
+# Failure screenshots are JPEGs: a fraction of the size of PNGs to encode and write
+SCREENSHOT_JPEG_QUALITY = 60
+
+
+def _search_url_prefix(config: dict) -> str:
     """
-    Handles browser automation and data extraction from Mercari.jp.
+    Builds the constant part of a search page URL; only the keyword varies.
     """
+    return f"{config['mercari_urls']['search_url']}?keyword="
 
-    def __init__(self, config: dict):
-        self.config = config
-        self.logger = get_logger("MercariScraper")
-        self.driver = None
 
-    def _create_driver(self) -> uc.Chrome:
-        """
-        Initializes a new instance of the undetected-chromedriver.
-        """
-        try:
-            options = uc.ChromeOptions()
-            if self.config["browser"]["headless"]:
-                options.add_argument("--headless=new")
+def _screenshot_path(filename: str) -> str:
+    """
+    Returns a timestamped .jpg path under screenshots/, creating the folder.
+    """
+    safe_filename = _UNSAFE_FN_RE.sub("", filename)
+    timestamp = time.strftime("%Y%m%d-%H%M%S")
+    os.makedirs("screenshots", exist_ok=True)
+    return os.path.join("screenshots", f"{safe_filename}_{timestamp}.jpg")
 
-            for option in self.config["browser"]["chrome_options"]:
-                options.add_argument(option)
 
-            self.logger.info("Creating new WebDriver instance...")
-            driver = uc.Chrome(options=options)
-            driver.set_page_load_timeout(
-                self.config["browser"]["page_load_timeout"]
-            )
-            return driver
-        except Exception as e:
-            self.logger.error(f"Failed to create WebDriver: {e}")
-            raise
+def _screenshots_enabled(config: dict) -> bool:
+    return config.get("debug", {}).get("screenshots_on_failure", True)
 
-    def _get_driver(self) -> uc.Chrome:
-        """
-        Provides a WebDriver instance, creating one if it doesn't exist.
-        """
-        if self.driver is None:
-            self.driver = self._create_driver()
-        return self.driver
 
-    def _parse_price_from_label(self, label_text: str) -> Optional[int]:
+class _ListingParser:
+    """
+    Turns raw listing rows scraped from a search page into products.
+    Shared by the browser scrapers; subclasses provide `self.logger`.
+    """
+
+    def _parse_price_from_label(self, label_text: Optional[str]) -> Optional[int]:
         """
         Extracts the Yen price from an aria-label string (e.g., "... 17,700円 ...").
         """
         if not label_text:
             return None
-        # Regex to find a number (with or without commas) followed by '円'
-        match = re.search(r"([\d,]+)円", label_text)
+        # Fast path: walk back from the first '円' over digits and commas
+        end = label_text.find("円")
+        start = end
+        while start > 0 and (
+            label_text[start - 1].isdigit() or label_text[start - 1] == ","
+        ):
+            start -= 1
+        digits = label_text[start:end].replace(",", "")
+        if digits.isdecimal():
+            return int(digits)
+
+        # Slow path: regex to find a number (with or without commas) followed by '円'
+        match = _PRICE_LABEL_RE.search(label_text)
         if match:
             try:
                 price_str = match.group(1).replace(",", "")
@@ -79,20 +145,26 @@ class MercariScraper:
                 return None
         return None
 
-    def _extract_product_data(self, listing_element) -> Optional[Dict]:
+    def _extract_product_data(self, row: ListingRow) -> Optional[Product]:
         """
-        Extracts all relevant data from a single product listing web element.
+        Builds a product from one raw listing row read by _EXTRACT_LISTINGS_JS.
         Returns None if the listing is invalid or filtered out.
         """
-        selectors = self.config["selectors"]["product_item"]
         try:
+            # URL and ID are derived from the 'href' inside the listing.
+            # Checked first: non-product tiles fail here cheaply.
+            url = row.get("url")
+            if not url:
+                self.logger.debug("Missing required element in product card.")
+                return None
+            match = _ITEM_ID_RE.search(url)
+            if not match:
+                return None
+            product_id = match.group(1)
+
             # --- CORRECTED PRICE LOGIC ---
-            # Find the specific div that contains the aria-label with the price.
-            price_container = listing_element.find_element(
-                By.CSS_SELECTOR, "div[role='img']"
-            )
-            aria_label = price_container.get_attribute("aria-label")
-            price = self._parse_price_from_label(aria_label)
+            # The price lives in the aria-label of the listing's div[role='img'].
+            price = self._parse_price_from_label(row.get("price_label"))
 
             # If we can't get a price, the listing is invalid. Skip it.
             if price is None:
@@ -101,137 +173,652 @@ class MercariScraper:
                 )
                 return None
 
-            # URL and ID are derived from the 'href' inside the listing.
-            link_element = listing_element.find_element(
-                By.CSS_SELECTOR, selectors["url"]
-            )
-            url = link_element.get_attribute("href")
-            match = re.search(r"/item/(m\d+)", url)
-            if not match:
+            title = row.get("title")
+            if title is None:
+                self.logger.debug("Missing required element in product card.")
                 return None
-            product_id = match.group(1)
-
-            # Title
-            title = listing_element.find_element(
-                By.CSS_SELECTOR, selectors["title"]
-            ).text.strip()
-
-            # Image URL
-            try:
-                img_element = listing_element.find_element(
-                    By.CSS_SELECTOR, selectors["image"]
-                )
-                image_url = img_element.get_attribute("src")
-            except NoSuchElementException:
-                image_url = None  # No image found
 
             return {
                 "id": product_id,
-                "title": title,
+                "title": title.strip(),
                 "price": price,
                 "url": url,
-                "image_url": image_url,
+                "image_url": row.get("image_url"),  # None if no image found
             }
-        except NoSuchElementException as e:
-            self.logger.debug(f"Missing required element in product card: {e}")
-            return None
         except Exception as e:
             self.logger.error(f"Error parsing product card: {e}")
             return None
 
+    def _rows_to_products(self, rows: List[ListingRow]) -> List[Product]:
+        """
+        Converts raw listing rows into products, dropping invalid ones.
+        """
+        self.logger.info(f"Found {len(rows)} potential listings on page.")
+        # Bound once: this runs for every listing on the page
+        extract = self._extract_product_data
+        products = [product for product in map(extract, rows) if product]
+        self.logger.info(f"Successfully extracted {len(products)} valid products.")
+        return products
+
+
+class MercariScraper(_ListingParser):
+    """
+    Handles browser automation and data extraction from Mercari.jp.
+    Safe to share between threads: each search checks out its own driver.
+    """
+
+    def __init__(self, config: dict):
+        self.config = config
+        self.logger = get_logger("MercariScraper")
+        self.search_url_prefix = _search_url_prefix(config)
+        browser_config = config["browser"]
+        self.pool = BrowserPool(
+            self._create_driver,
+            max_size=config["timing"].get("max_concurrency", 1),
+            min_size=browser_config.get("pool_min_size", 1),
+            idle_timeout_s=browser_config.get("pool_idle_timeout", 1800),
+            acquire_timeout_s=browser_config.get("pool_acquire_timeout", 120),
+            health_check_interval_s=browser_config.get(
+                "pool_health_check_interval", 30
+            ),
+            on_quit=self._return_profile_dir,
+        )
+
+        # One persistent profile per pool slot; Chrome locks a profile in use,
+        # so concurrent drivers can't share one. Cookies survive restarts.
+        self._profile_dirs: "queue.Queue[str]" = queue.Queue()
+        profile_root = config["browser"].get("user_data_dir")
+        if profile_root:
+            for slot in range(self.pool.max_size):
+                path = os.path.abspath(os.path.join(profile_root, f"driver-{slot}"))
+                os.makedirs(path, exist_ok=True)
+                self._profile_dirs.put(path)
+
+    def _create_driver(self) -> uc.Chrome:
+        """
+        Initializes a new instance of the undetected-chromedriver.
+        """
+        try:
+            import undetected_chromedriver as uc
+
+            options = uc.ChromeOptions()
+            if self.config["browser"]["headless"]:
+                options.add_argument("--headless=new")
+
+            for option in self.config["browser"]["chrome_options"]:
+                options.add_argument(option)
+            # Only the img src attribute is read, never the image bytes
+            options.add_argument("--blink-settings=imagesEnabled=false")
+
+            profile_dir = self._checkout_profile_dir()
+            if profile_dir:
+                options.add_argument("--profile-directory=Default")
+
+            self.logger.info("Creating new WebDriver instance...")
+            # Several drivers may start at once; don't re-patch a binary in use
+            try:
+                driver = uc.Chrome(
+                    options=options,
+                    user_data_dir=profile_dir,
+                    user_multi_procs=self.pool.max_size > 1,
+                )
+            except Exception:
+                if profile_dir:
+                    self._profile_dirs.put(profile_dir)
+                raise
+            driver.profile_dir = profile_dir
+            try:
+                driver.set_page_load_timeout(
+                    self.config["browser"]["page_load_timeout"]
+                )
+                self._block_resources(driver)
+            except Exception:
+                # Chrome is already running: stop it and free its profile
+                try:
+                    driver.quit()
+                except Exception as quit_error:
+                    self.logger.warning(f"Failed to quit WebDriver: {quit_error}")
+                self._return_profile_dir(driver)
+                raise
+            return driver
+        except Exception as e:
+            self.logger.error(f"Failed to create WebDriver: {e}")
+            raise
+
+    def _checkout_profile_dir(self) -> Optional[str]:
+        """
+        Takes a free persistent profile directory, or None if disabled.
+        """
+        try:
+            return self._profile_dirs.get_nowait()
+        except queue.Empty:
+            if self.config["browser"].get("user_data_dir"):
+                self.logger.warning(
+                    "No free Chrome profile directory; using a temporary one."
+                )
+            return None
+
+    def _return_profile_dir(self, driver: uc.Chrome):
+        """
+        Makes a quit driver's profile directory available again.
+        """
+        profile_dir = getattr(driver, "profile_dir", None)
+        if profile_dir:
+            self._profile_dirs.put(profile_dir)
+
+    def _block_resources(self, driver: uc.Chrome):
+        """
+        Stops the browser fetching images, fonts, styles and trackers the
+        scraper never reads, so listings render sooner.
+        """
+        patterns = self.config["browser"].get("blocked_url_patterns", [])
+        if not patterns:
+            return
+        try:
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": patterns})
+        except Exception as e:
+            # Blocking is only an optimisation; pages still load without it
+            self.logger.warning(f"Could not block resource loading: {e}")
+
+    def warm_up(self):
+        """
+        Starts the pool's drivers ahead of the first search.
+        """
+        self.pool.warm()
+
     def search_products(self, query: str) -> List[Dict]:
         """
         Performs a search on Mercari and scrapes the results.
         """
         try:
-            driver = self._get_driver()
-            search_url = (
-                f"{self.config['mercari_urls']['search_url']}?keyword={quote(query)}"
-            )
+            # A driver that raises is quarantined; the pool replaces it lazily
+            with self.pool.acquire() as driver:
+                return self._search_with_driver(driver, query)
+        except Exception as e:
+            self.logger.error(f"An unexpected error occurred during search: {e}")
+            return []
+
+    def _search_with_driver(self, driver: uc.Chrome, query: str) -> List[Dict]:
+        """
+        Loads the search page in the given driver and scrapes the results.
+        Re-raises unexpected errors so the pool discards the driver.
+        """
+        from selenium.common.exceptions import TimeoutException
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.support.ui import WebDriverWait
+
+        try:
+            search_url = self.search_url_prefix + quote(query)
             self.logger.info(f"Searching for query: '{query}'")
             driver.get(search_url)
 
-            listings_container_selector = self.config["selectors"][
-                "listings_container"
-            ]
+            selectors = self.config["selectors"]
             timeout = self.config["browser"]["implicit_wait"]
             WebDriverWait(driver, timeout).until(
                 EC.presence_of_element_located(
-                    (By.CSS_SELECTOR, listings_container_selector)
+                    (By.CSS_SELECTOR, selectors["listings_container"])
                 )
             )
 
-            # Find all individual product elements
-            listing_elements = driver.find_elements(
-                By.CSS_SELECTOR, self.config["selectors"]["product_listings"]
+            # Read every listing's fields in one round-trip to the browser
+            rows = driver.execute_script(
+                _EXTRACT_LISTINGS_JS,
+                selectors["product_listings"],
+                selectors["product_item"],
+            ) or []
+            return self._rows_to_products(rows)
+
+        except TimeoutException:
+            self.logger.error(
+                f"Timed out waiting for product listings for query: '{query}'. "
+                "Mercari may be blocking the request or has changed its layout."
             )
-            self.logger.info(
-                f"Found {len(listing_elements)} potential listings on page."
+            self.take_screenshot(f"failure_{query.replace(' ', '_')}", driver)
+            return []
+        except Exception:
+            self.take_screenshot(f"error_{query.replace(' ', '_')}", driver)
+            raise
+
+    def take_screenshot(self, filename: str, driver: Optional[uc.Chrome] = None):
+        """
+        Saves a screenshot of the given browser page for debugging.
+        """
+        if not _screenshots_enabled(self.config):
+            return
+        if not driver:
+            self.logger.warning("Cannot take screenshot, driver is not active.")
+            return
+
+        try:
+            # Capture straight from DevTools as a JPEG rather than a PNG
+            # round-tripped through the WebDriver protocol
+            data = driver.execute_cdp_cmd(
+                "Page.captureScreenshot",
+                {"format": "jpeg", "quality": SCREENSHOT_JPEG_QUALITY},
+            )["data"]
+            path = _screenshot_path(filename)
+            with open(path, "wb") as f:
+                f.write(base64.b64decode(data))
+            self.logger.info(f"Screenshot saved to: {path}")
+        except Exception as e:
+            self.logger.error(f"Failed to save screenshot: {e}")
+
+    def close(self):
+        """
+        Closes all pooled WebDriver sessions.
+        """
+        self.pool.close()
+
+
+class PlaywrightMercariScraper(_ListingParser):
+    """
+    Scrapes Mercari with async Playwright. A single Chromium process serves
+    every query: each search opens its own page on a background event loop,
+    with at most `timing.max_concurrency` pages in flight at once.
+    """
+
+    def __init__(self, config: dict):
+        if async_playwright is None:
+            raise ImportError(
+                "playwright is not installed; run 'pip install playwright' "
+                "and 'playwright install chromium'"
             )
+        self.config = config
+        self.logger = get_logger("PlaywrightMercariScraper")
+        self.search_url_prefix = _search_url_prefix(config)
+        self._playwright = None
+        self._browser = None
+        self._semaphore = None
 
-            products = []
-            for element in listing_elements:
-                product_data = self._extract_product_data(element)
-                if product_data:
-                    products.append(product_data)
+        # search_products is called from worker threads; the loop owns the browser
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="playwright-loop", daemon=True
+        )
+        self._thread.start()
+        self._run(self._start())
+
+    def _run(self, coro):
+        """
+        Runs a coroutine on the browser's event loop and waits for its result.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
 
-            self.logger.info(
-                f"Successfully extracted {len(products)} valid products."
+    async def _start(self):
+        browser_config = self.config["browser"]
+        self._semaphore = asyncio.Semaphore(
+            max(1, self.config["timing"].get("max_concurrency", 1))
+        )
+        self.logger.info("Launching Playwright Chromium...")
+        self._playwright = await async_playwright().start()
+        self._browser = await self._playwright.chromium.launch(
+            headless=browser_config["headless"],
+            args=browser_config["chrome_options"],
+        )
+
+    @staticmethod
+    async def _block_resources(route):
+        if route.request.resource_type in _PW_BLOCKED_RESOURCE_TYPES:
+            await route.abort()
+        else:
+            await route.continue_()
+
+    async def _search(self, query: str) -> List[ListingRow]:
+        browser_config = self.config["browser"]
+        selectors = self.config["selectors"]
+        search_url = self.search_url_prefix + quote(query)
+        width, height = browser_config["window_size"]
+
+        async with self._semaphore:
+            context = await self._browser.new_context(
+                viewport={"width": width, "height": height}, locale="ja-JP"
             )
-            return products
+            try:
+                await context.route("**/*", self._block_resources)
+                page = await context.new_page()
+                try:
+                    await page.goto(
+                        search_url,
+                        timeout=browser_config["page_load_timeout"] * 1000,
+                    )
+                    await page.wait_for_selector(
+                        selectors["listings_container"],
+                        timeout=browser_config["implicit_wait"] * 1000,
+                    )
+                    return await page.evaluate(
+                        _PW_EXTRACT_LISTINGS_JS,
+                        [selectors["product_listings"], selectors["product_item"]],
+                    )
+                except Exception:
+                    await self._take_screenshot(
+                        page, f"failure_{query.replace(' ', '_')}"
+                    )
+                    raise
+            finally:
+                await context.close()
 
-        except TimeoutException:
+    async def _take_screenshot(self, page, filename: str):
+        if not _screenshots_enabled(self.config):
+            return
+        try:
+            path = _screenshot_path(filename)
+            await page.screenshot(
+                path=path, type="jpeg", quality=SCREENSHOT_JPEG_QUALITY
+            )
+            self.logger.info(f"Screenshot saved to: {path}")
+        except Exception as e:
+            self.logger.error(f"Failed to save screenshot: {e}")
+
+    def warm_up(self):
+        """
+        The browser is launched in __init__; there is nothing to warm.
+        """
+
+    def search_products(self, query: str) -> List[Dict]:
+        """
+        Performs a search on Mercari and scrapes the results.
+        Safe to call concurrently from several threads.
+        """
+        self.logger.info(f"Searching for query: '{query}'")
+        try:
+            rows = self._run(self._search(query)) or []
+        except PlaywrightTimeoutError:
             self.logger.error(
                 f"Timed out waiting for product listings for query: '{query}'. "
                 "Mercari may be blocking the request or has changed its layout."
             )
-            self.take_screenshot(f"failure_{query.replace(' ', '_')}")
             return []
         except Exception as e:
             self.logger.error(f"An unexpected error occurred during search: {e}")
-            self.take_screenshot(f"error_{query.replace(' ', '_')}")
-            self.close()
             return []
 
-    def take_screenshot(self, filename: str):
+        return self._rows_to_products(rows)
+
+    async def _stop(self):
+        if self._browser is not None:
+            await self._browser.close()
+        if self._playwright is not None:
+            await self._playwright.stop()
+
+    def close(self):
         """
-        Saves a screenshot of the current browser page for debugging.
+        Closes the browser and stops the event loop.
         """
-        if not self.driver:
-            self.logger.warning("Cannot take screenshot, driver is not active.")
-            return
+        try:
+            self._run(self._stop())
+            self.logger.info("Playwright browser closed successfully.")
+        except Exception as e:
+            self.logger.error(f"Error closing Playwright browser: {e}")
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+
+
+def _b64url(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+class MercariHttpScraper:
+    """
+    Fetches Mercari search results from the JSON search API without a browser.
+    Falls back to a browser-based scraper when the API refuses the request.
+    """
+
+    # Status codes that indicate a bot challenge or throttling
+    FALLBACK_STATUS_CODES = (401, 403, 429)
+
+    def __init__(
+        self,
+        config: dict,
+        fallback: Optional[Union[MercariScraper, PlaywrightMercariScraper]] = None,
+    ):
+        self.config = config
+        self.logger = get_logger("MercariHttpScraper")
+        self.fallback = fallback
+
+        api_config = config.get("api", {})
+        self.search_url = config["mercari_urls"]["api_search_url"]
+        self.item_url = f"{config['mercari_urls']['base_url']}/item/"
+        self.page_size = api_config.get("page_size", 120)
+        self.timeout = api_config.get("timeout", 10)
+
+        # Validators from the last response per query, for conditional polls
+        etag_file = api_config.get("etag_cache_file")
+        self._etag_path = etag_file or None
+        self._validators: Dict[str, Dict[str, str]] = self._load_validators()
+
+        # Keep-alive session shared across queries
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Accept": "application/json",
+            "Content-Type": "application/json",
+            "X-Platform": "web",
+        })
+        # Concurrent queries share the session; keep a connection per worker
+        workers = max(1, config["timing"].get("max_concurrency", 1))
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=workers
+        )
+        self.session.mount("https://", adapter)
+
+        # The API expects requests signed with a DPoP proof from a client key
+        self._signing_key = ec.generate_private_key(ec.SECP256R1())
+        self._device_uuid = str(uuid.uuid4())
+        public_numbers = self._signing_key.public_key().public_numbers()
+        self._jwk = {
+            "crv": "P-256",
+            "kty": "EC",
+            "x": _b64url(public_numbers.x.to_bytes(32, "big")),
+            "y": _b64url(public_numbers.y.to_bytes(32, "big")),
+        }
+
+    def _dpop_proof(self, method: str, url: str) -> str:
+        """
+        Builds a signed DPoP JWT (ES256) for a single request.
+        """
+        header = {"typ": "dpop+jwt", "alg": "ES256", "jwk": self._jwk}
+        payload = {
+            "iat": int(time.time()),
+            "jti": str(uuid.uuid4()),
+            "htu": url,
+            "htm": method,
+            "uuid": self._device_uuid,
+        }
+        signing_input = (
+            _b64url(orjson.dumps(header))
+            + "."
+            + _b64url(orjson.dumps(payload))
+        )
+        der_signature = self._signing_key.sign(
+            signing_input.encode("ascii"), ec.ECDSA(hashes.SHA256())
+        )
+        r, s = decode_dss_signature(der_signature)
+        signature = r.to_bytes(32, "big") + s.to_bytes(32, "big")
+        return f"{signing_input}.{_b64url(signature)}"
+
+    def _build_search_payload(self, query: str) -> dict:
+        """
+        Builds the entities:search request body for a keyword search.
+        """
+        return {
+            "userId": "",
+            "pageSize": self.page_size,
+            "pageToken": "",
+            "searchSessionId": uuid.uuid4().hex,
+            "indexRouting": "INDEX_ROUTING_UNSPECIFIED",
+            "thumbnailTypes": [],
+            "searchCondition": {
+                "keyword": query,
+                "excludeKeyword": "",
+                "sort": "SORT_CREATED_TIME",
+                "order": "ORDER_DESC",
+                "status": [],
+                "sizeId": [],
+                "categoryId": [],
+                "brandId": [],
+                "sellerId": [],
+                "priceMin": 0,
+                "priceMax": 0,
+                "itemConditionId": [],
+                "shippingPayerId": [],
+                "shippingFromArea": [],
+                "shippingMethod": [],
+                "colorId": [],
+                "hasCoupon": False,
+                "attributes": [],
+                "itemTypes": [],
+                "skuIds": [],
+            },
+            "defaultDatasets": [],
+            "serviceFrom": "suruga",
+            "withItemBrand": False,
+            "withItemSize": False,
+            "withItemPromotions": False,
+            "withItemSizes": False,
+            "withShopname": False,
+        }
 
-        safe_filename = re.sub(r'[\\/*?:"<>|]', "", filename)
-        timestamp = time.strftime("%Y%m%d-%H%M%S")
-        path = os.path.join("screenshots", f"{safe_filename}_{timestamp}.png")
+    def _parse_item(self, item: dict) -> Optional[Dict]:
+        """
+        Maps one API search result onto the scraper's product dict.
+        """
+        try:
+            product_id = item["id"]
+            price = int(item["price"])
+            title = (item.get("name") or "").strip()
+            thumbnails = item.get("thumbnails") or []
+            return {
+                "id": product_id,
+                "title": title,
+                "price": price,
+                "url": f"{self.item_url}{product_id}",
+                "image_url": thumbnails[0] if thumbnails else None,
+            }
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            self.logger.debug(f"Skipping malformed API item: {e}")
+            return None
 
-        os.makedirs("screenshots", exist_ok=True)
+    def _load_validators(self) -> Dict[str, Dict[str, str]]:
+        if not self._etag_path or not os.path.exists(self._etag_path):
+            return {}
         try:
-            self.driver.save_screenshot(path)
-            self.logger.info(f"Screenshot saved to: {path}")
+            with open(self._etag_path, "rb") as f:
+                return orjson.loads(f.read())
         except Exception as e:
-            self.logger.error(f"Failed to save screenshot: {e}")
+            self.logger.warning(f"Failed to load ETag cache: {e}")
+            return {}
+
+    def _save_validators(self):
+        if not self._etag_path:
+            return
+        tmp_path = f"{self._etag_path}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(orjson.dumps(self._validators))
+            os.replace(tmp_path, self._etag_path)
+        except Exception as e:
+            self.logger.warning(f"Failed to save ETag cache: {e}")
+
+    def _conditional_headers(self, query: str) -> Dict[str, str]:
+        """
+        Builds If-None-Match / If-Modified-Since from the query's last response.
+        """
+        validators = self._validators.get(query, {})
+        headers = {}
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+        return headers
+
+    def _fallback_search(self, query: str) -> List[Dict]:
+        if self.fallback is None:
+            return []
+        self.logger.info(f"Falling back to browser search for query: '{query}'")
+        return self.fallback.search_products(query)
+
+    def search_products(self, query: str) -> List[Dict]:
+        """
+        Performs a search via the Mercari API, using the browser on refusal.
+        """
+        try:
+            self.logger.info(f"Searching API for query: '{query}'")
+            response = self.session.post(
+                self.search_url,
+                data=orjson.dumps(self._build_search_payload(query)),
+                headers={
+                    "DPoP": self._dpop_proof("POST", self.search_url),
+                    **self._conditional_headers(query),
+                },
+                timeout=self.timeout,
+            )
+        except requests.RequestException as e:
+            self.logger.warning(f"API search request failed: {e}")
+            return self._fallback_search(query)
+
+        if response.status_code == 304:
+            # Results unchanged since the last poll, so nothing can be new
+            self.logger.info(f"API results unchanged for query: '{query}'")
+            return []
+
+        if response.status_code in self.FALLBACK_STATUS_CODES:
+            self.logger.warning(
+                f"API search refused with HTTP {response.status_code} "
+                f"for query: '{query}'"
+            )
+            return self._fallback_search(query)
+
+        try:
+            response.raise_for_status()
+            body = orjson.loads(response.content)
+            items = (body.get("items") or []) if isinstance(body, dict) else None
+            if not isinstance(items, list):
+                raise ValueError("response has no list of items")
+        except (requests.HTTPError, orjson.JSONDecodeError, ValueError) as e:
+            self.logger.error(f"Invalid API search response: {e}")
+            return self._fallback_search(query)
+
+        products = []
+        for item in items:
+            product_data = self._parse_item(item)
+            if product_data:
+                products.append(product_data)
+
+        # Remember validators only once the page has been parsed: a later 304
+        # means "nothing new since these results were processed"
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if etag or last_modified:
+            self._validators[query] = {
+                "etag": etag or "",
+                "last_modified": last_modified or "",
+            }
+        else:
+            self._validators.pop(query, None)
+
+        self.logger.info(
+            f"Successfully extracted {len(products)} valid products from API."
+        )
+        return products
 
     def close(self):
         """
-        Closes the WebDriver session if it exists.
+        Persists ETags, then closes the HTTP session and the fallback browser.
         """
-        if self.driver:
-            try:
-                self.driver.quit()
-                self.logger.info("WebDriver closed successfully.")
-            except Exception as e:
-                self.logger.error(f"Error closing WebDriver: {e}")
-            finally:
-                self.driver = None
+        self._save_validators()
+        self.session.close()
+        if self.fallback is not None:
+            self.fallback.close()
 
 
 if __name__ == "__main__":
     # Example usage for testing the scraper directly
     print("--- Testing MercariScraper ---")
     try:
-        with open("config.json", "r", encoding="utf-8") as f:
-            test_config = json.load(f)
+        with open("config.json", "rb") as f:
+            test_config = orjson.loads(f.read())
     except FileNotFoundError:
         print(
             "Error: config.json not found. Please create it before running the test."
@@ -240,21 +827,26 @@ if __name__ == "__main__":
 
     test_config["browser"]["headless"] = False
 
+    # Same path as the monitor: API first, browser only on refusal
     scraper = MercariScraper(test_config)
+    if test_config.get("api", {}).get("enabled", False):
+        scraper = MercariHttpScraper(test_config, fallback=scraper)
     try:
-        # A query likely to have results
-        test_query = "レッツノート CF-SV8"
-        products_found = scraper.search_products(test_query)
-        if products_found:
-            print(
-                f"\n[SUCCESS] Found {len(products_found)} products for '{test_query}'."
-            )
-            print("Sample product:")
-            print(json.dumps(products_found[0], indent=2, ensure_ascii=False))
-        else:
-            print(
-                f"\n[FAILURE] Found 0 products. Check logs and screenshots folder."
-            )
+        # Queries from the command line, or one likely to have results
+        test_queries = sys.argv[1:] or ["レッツノート CF-SV8"]
+        for test_query in test_queries:
+            products_found = scraper.search_products(test_query)
+            if products_found:
+                print(
+                    f"\n[SUCCESS] Found {len(products_found)} products for '{test_query}'."
+                )
+                print("Sample product:")
+                print(orjson.dumps(products_found[0], option=orjson.OPT_INDENT_2).decode())
+            else:
+                print(
+                    f"\n[FAILURE] Found 0 products for '{test_query}'. "
+                    "Check logs and screenshots folder."
+                )
     finally:
-        print("\n--- Test finished. Closing driver. ---")
+        print("\n--- Test finished. Closing scraper. ---")
         scraper.close()
\ No newline at end of file
@@ -3,36 +3,109 @@
 Manages persistent storage of known products to prevent duplicate notifications.
 """
 
-import json
-from datetime import datetime, timedelta
+import heapq
+import os
+import time
+import orjson
+from dataclasses import dataclass
+from datetime import datetime
 from pathlib import Path
-from typing import Dict
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 from logging_config import get_logger
 
+try:
+    import ijson
+except ImportError:  # Optional: stream-parse large snapshots (falls back to orjson)
+    ijson = None
+
+# fdatasync skips flushing metadata; not available on macOS/Windows
+_fdatasync = getattr(os, "fdatasync", os.fsync)
+
+
+@dataclass
+class ProductRecord:
+    """One known product. Slotted: no per-instance dict across 100k+ records."""
+
+    __slots__ = ("id", "title", "price", "url", "image_url", "added_at")
+    id: str
+    title: str
+    price: int
+    url: str
+    image_url: Optional[str]
+    added_at: int  # Unix epoch seconds
+
+    @classmethod
+    def from_product(cls, product: dict, added_at: int) -> "ProductRecord":
+        return cls(
+            str(product["id"]),
+            product.get("title", ""),
+            product.get("price", 0),
+            product.get("url", ""),
+            product.get("image_url", ""),
+            added_at,
+        )
+
+    @classmethod
+    def from_stored(cls, product_id: str, data: dict) -> "ProductRecord":
+        added_at = data.get("added_at", 0)
+        if isinstance(added_at, str):
+            # Legacy ISO-8601 timestamp
+            try:
+                added_at = int(datetime.fromisoformat(added_at).timestamp())
+            except ValueError:
+                added_at = 0  # Dropped by the next cleanup
+        return cls(
+            product_id,
+            data.get("title", ""),
+            data.get("price", 0),
+            data.get("url", ""),
+            data.get("image_url", ""),
+            added_at,
+        )
+
+
 class ProductStorage:
     """
     Manages a persistent JSON database of products to track seen items.
+
+    New products are appended to a JSONL journal next to the snapshot, so a
+    crash loses nothing; the journal is folded back into the snapshot every
+    `compact_every` appends and on save.
     """
 
     def __init__(
         self,
         storage_path: str = "mercari_known_products.json",
         max_storage_days: int = 7,
+        compact_every: int = 1000,
     ):
         self.storage_path = Path(storage_path)
+        self.journal_path = self.storage_path.with_suffix(".jsonl")
         self.logger = get_logger("ProductStorage")
-        self.products: Dict[str, dict] = {}
+        self.products: Dict[str, ProductRecord] = {}
         self.max_storage_days = max_storage_days
+        self.compact_every = max(1, compact_every)
+        self._journal = None
+        # Records appended since the last snapshot
+        self._journal_count = 0
         self._load_existing_products()
+        self._replay_journal()
+        # (added_at, product_id), oldest first; cleanup pops only what expired
+        self._expiry_heap: List[Tuple[int, str]] = [
+            (record.added_at, product_id)
+            for product_id, record in self.products.items()
+        ]
+        heapq.heapify(self._expiry_heap)
 
     def _load_existing_products(self):
         """Loads existing products from the storage file into memory."""
         if self.storage_path.exists():
             try:
-                with open(self.storage_path, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                    self.products = data.get("products", {})
+                self.products = {
+                    product_id: ProductRecord.from_stored(product_id, product_data)
+                    for product_id, product_data in self._iter_stored_products()
+                }
                 self.logger.info(
                     "Loaded known products",
                     count=len(self.products),
@@ -51,41 +124,137 @@ class ProductStorage:
             )
             self.products = {}
 
+    def _iter_stored_products(self) -> Iterator[Tuple[str, dict]]:
+        """
+        Yields (product_id, data) pairs from the snapshot. With ijson each
+        entry is parsed as it is consumed, so the whole parsed tree never
+        sits in memory alongside the records built from it.
+        """
+        if ijson is None:
+            data = orjson.loads(self.storage_path.read_bytes())
+            yield from data.get("products", {}).items()
+            return
+        with open(self.storage_path, "rb") as f:
+            yield from ijson.kvitems(f, "products", use_float=True)
+
+    def _replay_journal(self):
+        """Applies products appended to the journal after the last snapshot."""
+        if not self.journal_path.exists():
+            return
+        replayed = 0
+        try:
+            with open(self.journal_path, "rb") as f:
+                for line in f:
+                    try:
+                        data = orjson.loads(line)
+                    except orjson.JSONDecodeError:
+                        # Torn final line from a crash mid-append
+                        continue
+                    product_id = str(data["id"])
+                    self.products[product_id] = ProductRecord.from_stored(
+                        product_id, data
+                    )
+                    replayed += 1
+        except Exception as e:
+            self.logger.error("Failed to replay product journal", error=str(e))
+        self._journal_count = replayed
+        if replayed:
+            self.logger.info(
+                "Replayed product journal",
+                count=replayed,
+                path=str(self.journal_path),
+            )
+
+    def _append_to_journal(self, records: List[ProductRecord]):
+        """Appends new records to the journal, compacting once it grows large."""
+        try:
+            if self._journal is None:
+                torn = self._has_torn_tail()
+                self._journal = open(self.journal_path, "ab", buffering=1 << 16)
+                if torn:
+                    # Terminate a torn line so it can't swallow the next record
+                    self._journal.write(b"\n")
+            self._journal.write(
+                b"".join(orjson.dumps(record) + b"\n" for record in records)
+            )
+            # One flush per batch: the OS has the lines even if we crash
+            self._journal.flush()
+        except Exception as e:
+            self.logger.error("Failed to append to product journal", error=str(e))
+            return
+        self._journal_count += len(records)
+        if self._journal_count >= self.compact_every:
+            try:
+                self.save_products()
+            except Exception:
+                pass  # Already logged; the journal still holds everything
+
+    def _has_torn_tail(self) -> bool:
+        """True if the journal's last line was cut short by a crash."""
+        try:
+            with open(self.journal_path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                return f.read(1) != b"\n"
+        except OSError:
+            return False  # Missing or empty
+
+    def _close_journal(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
     def add_product(self, product: dict):
-        """Adds a product to the in-memory storage. Does NOT save to disk."""
+        """Adds a product to the in-memory storage and the on-disk journal."""
         product_id = str(product["id"])
         if product_id not in self.products:
-            self.products[product_id] = {
-                "id": product_id,
-                "title": product.get("title", ""),
-                "price": product.get("price", 0),
-                "url": product.get("url", ""),
-                "image_url": product.get("image_url", ""),
-                "added_at": datetime.now().isoformat(),
-            }
+            record = ProductRecord.from_product(product, int(time.time()))
+            self.products[product_id] = record
+            heapq.heappush(self._expiry_heap, (record.added_at, product_id))
+            self._append_to_journal([record])
             self.logger.debug(
                 "Added product to in-memory store", product_id=product_id
             )
 
+    def add_products(self, products: List[dict]):
+        """Adds several products in one pass with a single journal write."""
+        added_at = int(time.time())
+        added = []
+        for product in products:
+            product_id = str(product["id"])
+            if product_id in self.products:
+                continue
+            record = ProductRecord.from_product(product, added_at)
+            self.products[product_id] = record
+            heapq.heappush(self._expiry_heap, (added_at, product_id))
+            added.append(record)
+        if added:
+            self._append_to_journal(added)
+            self.logger.debug("Added products to in-memory store", count=len(added))
+
     def is_product_known(self, product_id: str) -> bool:
         """Checks if a product ID is in the in-memory storage."""
         return str(product_id) in self.products
 
+    def are_known(self, product_ids: Iterable[str]) -> Set[str]:
+        """Returns the subset of the given product IDs already in storage."""
+        return {str(pid) for pid in product_ids}.intersection(self.products)
+
     def cleanup_old_products(self) -> int:
-        """Removes old products from the in-memory storage. Does NOT save to disk."""
-        cutoff = datetime.now() - timedelta(days=self.max_storage_days)
-        initial_count = len(self.products)
-        products_to_keep = {}
-        for product_id, product_data in self.products.items():
-            try:
-                added_time = datetime.fromisoformat(product_data["added_at"])
-                if added_time >= cutoff:
-                    products_to_keep[product_id] = product_data
-            except (ValueError, KeyError):
-                continue
-        removed_count = initial_count - len(products_to_keep)
+        """
+        Removes old products from the in-memory storage. Does NOT save to disk:
+        journal entries keep their added_at, so replayed ones expire again.
+        """
+        # Pop expired entries off the heap instead of scanning every product
+        cutoff = int(time.time()) - self.max_storage_days * 86400
+        heap = self._expiry_heap
+        removed_count = 0
+        while heap and heap[0][0] < cutoff:
+            added_at, product_id = heapq.heappop(heap)
+            record = self.products.get(product_id)
+            if record is not None and record.added_at == added_at:
+                del self.products[product_id]
+                removed_count += 1
         if removed_count > 0:
-            self.products = products_to_keep
             self.logger.info(
                 "Cleaned up old products from memory", count=removed_count
             )
@@ -93,7 +262,7 @@ class ProductStorage:
 
     def save_products(self):
         """Saves the current state of the in-memory product database to the JSON file."""
-        backup_path = self.storage_path.with_suffix(".backup.json")
+        tmp_path = self.storage_path.with_suffix(".tmp")
         try:
             data_to_save = {
                 "metadata": {
@@ -102,13 +271,20 @@ class ProductStorage:
                 },
                 "products": self.products,
             }
-            # Only backup if the file exists and we're not saving an empty database
-            if self.storage_path.exists() and self.products:
-                self.storage_path.rename(backup_path)
-            with open(self.storage_path, "w", encoding="utf-8") as f:
-                json.dump(data_to_save, f, indent=2, ensure_ascii=False)
-            if backup_path.exists():
-                backup_path.unlink()
+            # Write a sibling file and swap it in atomically: a crash mid-write
+            # leaves the previous database intact, so no backup copy is needed
+            with open(tmp_path, "wb") as f:
+                f.write(orjson.dumps(data_to_save))
+                f.flush()
+                # Data must be on disk before the rename makes it visible
+                _fdatasync(f.fileno())
+            os.replace(tmp_path, self.storage_path)
+            # Everything in the journal is now in the snapshot. A crash before
+            # the unlink only replays records that are already present.
+            self._close_journal()
+            if self.journal_path.exists():
+                self.journal_path.unlink()
+            self._journal_count = 0
             self.logger.info(
                 "Successfully saved products",
                 count=len(self.products),
@@ -116,9 +292,8 @@ class ProductStorage:
             )
         except Exception as e:
             self.logger.error("Failed to save product storage", error=str(e))
-            if backup_path.exists() and not self.storage_path.exists():
-                backup_path.rename(self.storage_path)
-                self.logger.warning("Restored database from backup.")
+            if tmp_path.exists():
+                tmp_path.unlink()
             raise
 
     def get_storage_stats(self) -> dict:
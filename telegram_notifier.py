@@ -1,12 +1,19 @@
 #!/usr/bin/env python3.9
+import functools
 import os
+import queue
+import threading
 import time
 import requests
 from datetime import datetime
-from typing import List, Dict
+from typing import Callable, Dict, List, Optional, Tuple
 
 from logging_config import get_logger
 
+# MarkdownV2 reserved characters, escaped in a single translate() pass
+_MD2_SPECIAL_CHARS = "_*[]()~`>#+-=|{}.!"
+_MD2_ESCAPE_TABLE = str.maketrans({c: "\\" + c for c in _MD2_SPECIAL_CHARS})
+
 
 class TelegramNotifier:
     """
@@ -25,10 +32,29 @@ class TelegramNotifier:
             raise ValueError("TELEGRAM_BOT_TOKEN and TELEGRAM_CHAT_ID must be set in .env")
 
         self.base_url = f"https://api.telegram.org/bot{self.bot_token}"
+        self.rate_limit_delay = config["notifications"]["rate_limit_delay"]
+        # Monotonic time before which the next send must wait
+        self._next_send_at = 0.0
+        # Products sharing one sendMediaGroup album (Telegram allows up to 10)
+        self.max_images = min(
+            10, config["notifications"].get("max_images_per_notification", 5)
+        )
+        # Keep-alive session: one TLS handshake per connection, not per message
+        self.session = requests.Session()
+
         # Default JPY to EUR rate. Update this value if the rate changes significantly.
         # Example: If 1 EUR = 155 JPY, then 1 JPY = 1/155 = 0.0064 EUR
         self.current_exchange_rate = 0.0064
 
+        # Query workers hand products to one sender thread and move on; it
+        # paces the sends, keeping the chat's order and rate limit intact.
+        # Started last so it never sees a partly built notifier.
+        self._outbox = queue.Queue()
+        self._sender = threading.Thread(
+            target=self._send_loop, name="telegram-sender", daemon=True
+        )
+        self._sender.start()
+
     def _get_exchange_rate(self) -> float:
         """
         Returns the default exchange rate to avoid slow and unreliable API calls.
@@ -36,33 +62,40 @@ class TelegramNotifier:
         self.logger.debug("Using default exchange rate to prevent API timeout.")
         return self.current_exchange_rate
 
-    def _convert_jpy_to_eur(self, jpy_amount: int) -> float:
-        """Convert JPY amount to EUR using the stored rate."""
+    def _convert_jpy_to_eur_cents(self, jpy_amount: int) -> int:
+        """Convert JPY amount to whole EUR cents using the stored rate."""
         rate = self._get_exchange_rate()
-        eur_amount = jpy_amount * rate
-        return round(eur_amount, 2)
-        
-    def _format_price_message(self, jpy_price: int, eur_price: float) -> str:
-        """Format price message with both currencies, escaping all special characters."""
-        # Format the euro price to a string and escape the decimal point.
-        eur_price_str = f"{eur_price:.2f}".replace('.', '\\.')
-        
-        # Construct the final string, escaping '(', '~', and ')' for Telegram.
-        return f"¥{jpy_price:,} \\(\\~€{eur_price_str}\\)"
+        return round(jpy_amount * rate * 100)
         
-        # Construct the final string with escaped parentheses and the escaped price
-        return f"¥{jpy_price:,} \\(~€{escaped_eur_price}\\)"
+    @staticmethod
+    @functools.lru_cache(maxsize=4096)
+    def _format_price_message(jpy_price: int, eur_cents: int) -> str:
+        """
+        Format price message with both currencies, escaping all special characters.
+        Memoized: listings cluster on the same price points.
+        """
+        # Integer cents: no float formatting, and the decimal point is
+        # written pre-escaped. '(', '~' and ')' are escaped for Telegram too.
+        return f"¥{jpy_price:,} \\(\\~€{eur_cents // 100}\\.{eur_cents % 100:02d}\\)"
+
+    def _wait_for_send_slot(self):
+        """
+        Spaces sends `rate_limit_delay` apart, sleeping only for whatever part
+        of the gap the previous request's own latency has not already used.
+        """
+        now = time.monotonic()
+        delay = self._next_send_at - now
+        if delay > 0:
+            time.sleep(delay)
+        self._next_send_at = max(now, self._next_send_at) + self.rate_limit_delay
 
     def _format_product_message(self, product: Dict, query: str) -> str:
         """Format individual product message for Telegram."""
-        eur_price = self._convert_jpy_to_eur(product['price'])
-        price_msg = self._format_price_message(product['price'], eur_price)
+        eur_cents = self._convert_jpy_to_eur_cents(product['price'])
+        price_msg = self._format_price_message(product['price'], eur_cents)
 
         # Using MarkdownV2 requires escaping special characters.
-        # This is a basic set of characters to escape.
-        title = product['title']
-        for char in ['_', '*', '[', ']', '(', ')', '~', '`', '>', '#', '+', '-', '=', '|', '{', '}', '.', '!']:
-            title = title.replace(char, f'\\{char}')
+        title = product['title'].translate(_MD2_ESCAPE_TABLE)
 
         message = f"🚀 *New Product Found*\n\n"
         message += f"*{title}*\n"
@@ -74,7 +107,7 @@ class TelegramNotifier:
 
     def send_telegram_message(self, message: str, photo_url: str = None) -> bool:
         """Sends a message to Telegram, trying photo first, then text."""
-        time.sleep(self.config["notifications"]["rate_limit_delay"])
+        self._wait_for_send_slot()
 
         payload = {'chat_id': self.chat_id, 'parse_mode': 'MarkdownV2'}
         
@@ -83,7 +116,7 @@ class TelegramNotifier:
             if photo_url:
                 payload.update({'photo': photo_url, 'caption': message[:1024]})
                 url = f"{self.base_url}/sendPhoto"
-                response = requests.post(url, json=payload, timeout=30)
+                response = self.session.post(url, json=payload, timeout=30)
                 if response.status_code == 200:
                     self.logger.debug("Telegram photo message sent successfully.")
                     return True
@@ -95,7 +128,7 @@ class TelegramNotifier:
             payload.pop('caption', None)
             payload['text'] = message[:4096]
             url = f"{self.base_url}/sendMessage"
-            response = requests.post(url, json=payload, timeout=30)
+            response = self.session.post(url, json=payload, timeout=30)
 
             if response.status_code == 200:
                 self.logger.debug("Telegram text message sent successfully.")
@@ -108,6 +141,68 @@ class TelegramNotifier:
             self.logger.error(f"Exception while sending Telegram message: {e}")
             return False
 
+    def send_media_group(self, photos: List[Tuple[str, str]]) -> bool:
+        """
+        Sends 2-10 products as one album, each photo captioned with its details.
+
+        Args:
+            photos: (image_url, formatted message) pairs, one per product.
+
+        Returns:
+            True if Telegram accepted the album.
+        """
+        self._wait_for_send_slot()
+        try:
+            media = [
+                {
+                    'type': 'photo',
+                    'media': photo_url,
+                    'caption': message[:1024],
+                    'parse_mode': 'MarkdownV2',
+                }
+                for photo_url, message in photos
+            ]
+            payload = {'chat_id': self.chat_id, 'media': media}
+            url = f"{self.base_url}/sendMediaGroup"
+            response = self.session.post(url, json=payload, timeout=30)
+            if response.status_code == 200:
+                self.logger.debug(f"Telegram album of {len(photos)} products sent successfully.")
+                return True
+            self.logger.warning(f"Failed to send album, sending one by one. Reason: {response.text}")
+            return False
+        except Exception as e:
+            self.logger.error(f"Exception while sending Telegram album: {e}")
+            return False
+
+    def send_product_group(self, products: List[Dict], query: str):
+        """
+        Sends products in listing order: each run of consecutive products with
+        photos goes out as one album, falling back to one message each if the
+        album fails; products without a photo split runs and are sent singly.
+        Each message is formatted once and reused by the fallback.
+        """
+        rendered = []
+        for product in products:
+            try:
+                message = self._format_product_message(product, query)
+            except Exception as e:
+                self.logger.error(f"Error formatting single product notification: {e}")
+                continue
+            rendered.append((product.get('image_url'), message))
+
+        run = []
+        for item in rendered + [(None, None)]:
+            if item[0]:
+                run.append(item)
+                continue
+            if len(run) > 1 and self.send_media_group(run):
+                run = []
+            for photo_url, message in run:
+                self.send_telegram_message(message, photo_url)
+            run = []
+            if item[1] is not None:
+                self.send_telegram_message(item[1])
+
     def send_notification(self, product: Dict, query: str) -> bool:
         """Formats and sends a notification for a single product."""
         try:
@@ -117,14 +212,57 @@ class TelegramNotifier:
             self.logger.error(f"Error formatting single product notification: {e}")
             return False
 
-    def send_notifications(self, products: List[Dict], query: str):
-        """Main entry point to send notifications for a list of products."""
+    def send_notifications(
+        self,
+        products: List[Dict],
+        query: str,
+        on_sent: Optional[Callable[[List[Dict]], None]] = None,
+    ):
+        """
+        Main entry point to send notifications for a list of products.
+        Queues them for the sender thread and returns without waiting.
+
+        Args:
+            products: Products to notify about.
+            query: Search query the products were found for.
+            on_sent: Called from the sender thread with each group of products
+                once its send has been attempted, successful or not.
+        """
         if not products:
             return
 
-        self.logger.info(f"Sending {len(products)} notifications for query: '{query}'")
-        for product in products:
-            self.send_notification(product, query)
+        self.logger.info(f"Queueing {len(products)} notifications for query: '{query}'")
+        step = max(1, self.max_images)
+        for i in range(0, len(products), step):
+            self._outbox.put((products[i:i + step], query, on_sent))
+
+    def _send_loop(self):
+        while True:
+            item = self._outbox.get()
+            try:
+                if item is None:
+                    return
+                products, query, on_sent = item
+                try:
+                    self.send_product_group(products, query)
+                finally:
+                    if on_sent is not None:
+                        on_sent(products)
+            except Exception as e:
+                self.logger.error(f"Notification sender error: {e}")
+            finally:
+                self._outbox.task_done()
+
+    def close(self):
+        """
+        Sends any queued notifications, then closes the HTTP session.
+        """
+        pending = self._outbox.qsize()
+        if pending:
+            self.logger.info(f"Sending {pending} queued notifications before exit")
+        self._outbox.put(None)
+        self._sender.join()
+        self.session.close()
 
 
 if __name__ == "__main__":
@@ -137,8 +275,9 @@ if __name__ == "__main__":
     
     # Load config for testing
     try:
-        with open("config.json", 'r', encoding="utf-8") as f:
-            test_config = json.load(f)
+        import orjson
+        with open("config.json", "rb") as f:
+            test_config = orjson.loads(f.read())
     except FileNotFoundError:
         print("Error: config.json not found. Please create it before running the test.")
         exit(1)